@@ -5,17 +5,29 @@
 """
 
 import os
+import copy
 import logging
 from pathlib import Path
 from dataclasses import dataclass, field
-from typing import Optional
+from functools import cached_property
+from typing import Optional, TYPE_CHECKING
 
-import yaml
-from dotenv import load_dotenv
+if TYPE_CHECKING:
+    import pathspec
 
 
 logger = logging.getLogger(__name__)
 
+# 配置使用的环境变量
+_ENV_KEYS = ("OPENAI_MODEL", "OPENAI_BASE_URL", "OPENAI_API_KEY")
+
+# 环境变量快照（首次加载配置时读取 .env 并缓存，之后复用）
+_DOTENV_LOADED = False
+_ENV: dict[str, Optional[str]] = {}
+
+# YAML 解析缓存，键为 (配置文件路径, 修改时间)
+_YAML_CACHE: dict[tuple[str, int], dict] = {}
+
 # 默认配置
 DEFAULT_CONFIG = {
     "file_filter": {
@@ -41,6 +53,8 @@ DEFAULT_CONFIG = {
         "temperature": 0.3,
         "max_input_tokens": 100000,
         "reserved_tokens": 10000,
+        "parallel_summarize": False,
+        "max_concurrency": 8,
     },
     "output": {
         "output_dir": "./repo2doc-output",
@@ -61,6 +75,16 @@ class FileFilterConfig:
     exclude_patterns: list[str] = field(default_factory=list)
     max_file_size: int = 102400
     max_files: int = 500
+    
+    @cached_property
+    def compiled_spec(self) -> "pathspec.PathSpec":
+        """编译后的排除规则（首次访问时编译并缓存）"""
+        import pathspec
+        
+        return pathspec.PathSpec.from_lines(
+            pathspec.patterns.GitWildMatchPattern,
+            self.exclude_patterns
+        )
 
 
 @dataclass
@@ -72,6 +96,8 @@ class LLMConfig:
     reserved_tokens: int = 10000
     base_url: Optional[str] = None
     api_key: Optional[str] = None
+    parallel_summarize: bool = False
+    max_concurrency: int = 8
 
 
 @dataclass
@@ -96,6 +122,8 @@ class PromptConfig:
     first_chunk: str = ""
     incremental: str = ""
     next_chunk: str = ""
+    summarize: str = ""
+    merge: str = ""
 
 
 @dataclass
@@ -118,16 +146,15 @@ class Config:
         Returns:
             配置对象
         """
-        # 加载环境变量
-        load_dotenv()
+        # 加载环境变量（带缓存）
+        env = _load_env()
         
         # 加载 YAML 配置
         if config_path and Path(config_path).exists():
-            with open(config_path, "r", encoding="utf-8") as f:
-                yaml_data = yaml.safe_load(f) or {}
+            yaml_data = _load_yaml(config_path)
             logger.info(f"从 {config_path} 加载配置")
         else:
-            yaml_data = DEFAULT_CONFIG.copy()
+            yaml_data = {}
             logger.info("使用默认配置")
         
         # 合并默认配置
@@ -142,12 +169,14 @@ class Config:
         )
         
         llm = LLMConfig(
-            model=os.getenv("OPENAI_MODEL", merged["llm"]["model"]),
+            model=env["OPENAI_MODEL"] or merged["llm"]["model"],
             temperature=merged["llm"]["temperature"],
             max_input_tokens=merged["llm"]["max_input_tokens"],
             reserved_tokens=merged["llm"]["reserved_tokens"],
-            base_url=os.getenv("OPENAI_BASE_URL", merged["llm"].get("base_url")),
-            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=env["OPENAI_BASE_URL"] or merged["llm"].get("base_url"),
+            api_key=env["OPENAI_API_KEY"],
+            parallel_summarize=merged["llm"]["parallel_summarize"],
+            max_concurrency=merged["llm"]["max_concurrency"],
         )
         
         output = OutputConfig(
@@ -166,6 +195,8 @@ class Config:
             first_chunk=merged.get("prompts", {}).get("first_chunk", ""),
             incremental=merged.get("prompts", {}).get("incremental", ""),
             next_chunk=merged.get("prompts", {}).get("next_chunk", ""),
+            summarize=merged.get("prompts", {}).get("summarize", ""),
+            merge=merged.get("prompts", {}).get("merge", ""),
         )
         
         return Config(
@@ -175,12 +206,91 @@ class Config:
             logging=logging_config,
             prompts=prompts,
         )
+    
+    @staticmethod
+    def clear_env_cache() -> None:
+        """
+        清除环境变量缓存
+        
+        下次加载配置时会重新读取 .env 文件和环境变量（主要用于测试）。
+        """
+        global _DOTENV_LOADED
+        _DOTENV_LOADED = False
+        _ENV.clear()
+
+
+def _load_env() -> dict[str, Optional[str]]:
+    """
+    加载 .env 文件并缓存配置所需的环境变量
+    
+    Returns:
+        环境变量快照
+    """
+    global _DOTENV_LOADED
+    if not _DOTENV_LOADED:
+        # 仅在存在 .env 文件时才导入 python-dotenv
+        dotenv_path = _find_dotenv()
+        if dotenv_path:
+            from dotenv import load_dotenv
+            load_dotenv(dotenv_path)
+        _ENV.update({key: os.environ.get(key) for key in _ENV_KEYS})
+        _DOTENV_LOADED = True
+    return _ENV
+
+
+def _find_dotenv() -> Optional[str]:
+    """
+    查找 .env 文件
+    
+    与 python-dotenv 的默认行为一致：从本模块所在目录开始逐级向上查找。
+    
+    Returns:
+        .env 文件路径，未找到返回 None
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        candidate = os.path.join(directory, ".env")
+        if os.path.isfile(candidate):
+            return candidate
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def _load_yaml(config_path: str) -> dict:
+    """
+    解析 YAML 配置文件（按修改时间缓存）
+    
+    Args:
+        config_path: 配置文件路径
+    
+    Returns:
+        解析结果（缓存数据的深拷贝，可安全修改）
+    """
+    key = (config_path, Path(config_path).stat().st_mtime_ns)
+    data = _YAML_CACHE.get(key)
+    if data is None:
+        # 延迟导入 PyYAML，使用默认配置时无需加载；优先使用 libyaml 的 C 实现
+        import yaml
+        loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+        
+        with open(config_path, "r", encoding="utf-8") as f:
+            data = yaml.load(f, Loader=loader) or {}
+        # 文件已修改时丢弃旧版本的缓存
+        for stale in [k for k in _YAML_CACHE if k[0] == config_path]:
+            del _YAML_CACHE[stale]
+        _YAML_CACHE[key] = data
+    return copy.deepcopy(data)
 
 
 def _deep_merge(base: dict, override: dict) -> dict:
     """
     深度合并两个字典
     
+    迭代实现，只复制确实被覆盖的子字典，未覆盖的分支与 base 共享。
+    base 本身不会被修改。
+    
     Args:
         base: 基础字典
         override: 覆盖字典
@@ -188,12 +298,22 @@ def _deep_merge(base: dict, override: dict) -> dict:
     Returns:
         合并后的字典
     """
+    if not override:
+        return base
+    
     result = base.copy()
-    for key, value in override.items():
-        if key in result and isinstance(result[key], dict) and isinstance(value, dict):
-            result[key] = _deep_merge(result[key], value)
-        else:
-            result[key] = value
+    stack = [(result, override)]
+    while stack:
+        target, source = stack.pop()
+        for key, value in source.items():
+            current = target.get(key)
+            if isinstance(current, dict) and isinstance(value, dict):
+                if value:
+                    merged = current.copy()
+                    target[key] = merged
+                    stack.append((merged, value))
+            else:
+                target[key] = value
     return result
 
 
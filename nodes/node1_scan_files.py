@@ -5,16 +5,29 @@
 """
 
 import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Iterator, Optional
+
+import pathspec
 
 from state import Repo2DocState, FileInfo
 from config_loader import Config
-from utils.file_utils import read_file_content, get_file_extension
-from utils.token_counter import count_tokens
+from utils.file_utils import read_file_content
+from utils.token_counter import count_tokens_batch
+from utils.token_cache import TOKEN_CACHE_FILENAME, content_hash, load_token_cache, save_token_cache
 
 
 logger = logging.getLogger(__name__)
 
+# 读取文件的线程数（I/O 密集型，线程数可以多于 CPU 核数）
+_IO_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# 形如 "**/node_modules/**" 的排除规则，可直接按目录名剪枝
+_DIR_NAME_PATTERN = re.compile(r"^\*\*/([^*?\[\]/]+)/\*\*$")
+
 
 def scan_files(state: Repo2DocState, config: Config) -> Repo2DocState:
     """
@@ -43,44 +56,53 @@ def scan_files(state: Repo2DocState, config: Config) -> Repo2DocState:
         logger.error(state["error"])
         return state
     
-    all_files: list[FileInfo] = []
-    include_extensions = set(config.file_filter.include_extensions)
+    include_extensions = frozenset(ext.lower() for ext in config.file_filter.include_extensions)
+    max_file_size = config.file_filter.max_file_size
     
-    # 递归扫描目录
-    for file_path in repo_path.rglob("*"):
-        if not file_path.is_file():
-            continue
-        
-        # 检查扩展名
-        ext = get_file_extension(str(file_path))
-        if ext not in include_extensions:
-            continue
-        
-        # 获取相对路径
-        relative_path = str(file_path.relative_to(repo_path))
-        
-        # 读取文件内容
-        content = read_file_content(
-            str(file_path),
-            max_size=config.file_filter.max_file_size
-        )
-        
-        if content is None:
-            continue
-        
-        # 计算 token 数量
-        token_count = count_tokens(content)
-        
-        file_info = FileInfo(
+    # 排除规则中包含取反模式时，子目录中的文件可能被重新包含，此时不剪枝
+    exclude_patterns = config.file_filter.exclude_patterns
+    exclude_spec = None
+    prune_names: frozenset[str] = frozenset()
+    if not any(p.startswith("!") for p in exclude_patterns):
+        exclude_spec = config.file_filter.compiled_spec
+        prune_names = _literal_dir_names(exclude_patterns)
+    
+    # 1. 收集候选文件（按扩展名过滤，跳过被排除的目录）
+    candidates = list(_iter_candidate_files(
+        str(repo_path), include_extensions, max_file_size, exclude_spec, prune_names
+    ))
+    
+    # 2. 并发读取文件内容（I/O 密集型）
+    with ThreadPoolExecutor(max_workers=_IO_WORKERS) as executor:
+        contents = list(executor.map(
+            lambda item: read_file_content(item[0], max_size=max_file_size),
+            candidates,
+        ))
+    
+    loaded = [
+        (candidate, content)
+        for candidate, content in zip(candidates, contents)
+        if content is not None
+    ]
+    
+    # 3. 计算 token 数：内容未变化的文件使用缓存，其余批量编码（tiktoken 在 Rust 端并行）
+    token_counts = _count_tokens_cached(
+        [content for _, content in loaded],
+        repo_path,
+        config,
+    )
+    
+    all_files: list[FileInfo] = []
+    for (candidate, content), token_count in zip(loaded, token_counts):
+        absolute_path, relative_path, ext, size = candidate
+        all_files.append(FileInfo(
             path=relative_path,
-            absolute_path=str(file_path),
+            absolute_path=absolute_path,
             content=content,
             extension=ext,
-            size=file_path.stat().st_size,
+            size=size,
             token_count=token_count,
-        )
-        
-        all_files.append(file_info)
+        ))
     
     # 更新状态
     state["all_files"] = all_files
@@ -90,3 +112,150 @@ def scan_files(state: Repo2DocState, config: Config) -> Repo2DocState:
     logger.info(f"扫描完成，共找到 {len(all_files)} 个文件")
     
     return state
+
+
+def _count_tokens_cached(contents: list[str], repo_path: Path, config: Config) -> list[int]:
+    """
+    计算文件的 token 数，按内容哈希复用上次运行的结果
+    
+    写回时只保留本次扫描到的文件，避免缓存无限增长。
+    
+    Args:
+        contents: 文件内容列表
+        repo_path: 仓库路径
+        config: 配置对象
+    
+    Returns:
+        每个文件的 token 数，顺序与输入一致
+    """
+    upper_bound = config.llm.max_input_tokens
+    cache_path = repo_path / config.output.output_dir / TOKEN_CACHE_FILENAME
+    cache = load_token_cache(cache_path, str(repo_path), upper_bound)
+    
+    hashes = [content_hash(content) for content in contents]
+    missing = [i for i, h in enumerate(hashes) if h not in cache]
+    if missing:
+        counts = count_tokens_batch([contents[i] for i in missing], upper_bound=upper_bound)
+        for i, count in zip(missing, counts):
+            cache[hashes[i]] = count
+    
+    logger.debug(f"token 缓存命中 {len(hashes) - len(missing)}/{len(hashes)} 个文件")
+    
+    tokens = {h: cache[h] for h in hashes}
+    if missing or len(tokens) != len(cache):
+        save_token_cache(cache_path, str(repo_path), upper_bound, tokens)
+    
+    return [tokens[h] for h in hashes]
+
+
+def _walk(
+    root: str,
+    exclude_spec: Optional[pathspec.PathSpec] = None,
+    prune_names: frozenset[str] = frozenset()
+) -> Iterator[os.DirEntry]:
+    """
+    基于 os.scandir 的迭代式目录遍历
+    
+    DirEntry 会缓存 readdir 返回的类型信息，避免对每个条目重复 stat。
+    不跟随目录符号链接，防止循环遍历。匹配排除规则的目录整棵跳过。
+    
+    Args:
+        root: 根目录
+        exclude_spec: 排除规则（可选）
+        prune_names: 直接跳过的目录名集合（无需匹配排除规则）
+    
+    Yields:
+        文件条目
+    """
+    prefix_len = len(os.path.join(root, ""))
+    
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name in prune_names or (
+                            exclude_spec is not None
+                            and exclude_spec.match_file(entry.path[prefix_len:] + "/")
+                        ):
+                            logger.debug(f"排除目录: {entry.path}")
+                            continue
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        yield entry
+        except OSError as e:
+            logger.warning(f"无法读取目录 {current}: {e}")
+
+
+def _literal_dir_names(exclude_patterns: list[str]) -> frozenset[str]:
+    """
+    提取可按目录名直接剪枝的排除规则
+    
+    例如 "**/node_modules/**" 对应目录名 "node_modules"，
+    遍历时用集合查找即可判断，无需进行正则匹配。
+    
+    Args:
+        exclude_patterns: 排除规则列表
+    
+    Returns:
+        目录名集合
+    """
+    names = set()
+    for pattern in exclude_patterns:
+        match = _DIR_NAME_PATTERN.match(pattern)
+        if match:
+            names.add(match.group(1))
+    return frozenset(names)
+
+
+def _iter_candidate_files(
+    repo_path: str,
+    include_extensions: frozenset[str],
+    max_file_size: int,
+    exclude_spec: Optional[pathspec.PathSpec] = None,
+    prune_names: frozenset[str] = frozenset()
+) -> Iterator[tuple[str, str, str, int]]:
+    """
+    递归遍历目录，产出扩展名匹配且未超过大小限制的文件
+    
+    超过大小限制的文件在读取之前即被跳过。
+    
+    Args:
+        repo_path: 仓库路径
+        include_extensions: 包含的扩展名集合
+        max_file_size: 最大文件大小（字节）
+        exclude_spec: 排除规则（可选），用于目录剪枝
+        prune_names: 直接跳过的目录名集合
+    
+    Yields:
+        (绝对路径, 相对路径, 扩展名, 文件大小)
+    """
+    prefix_len = len(os.path.join(repo_path, ""))
+    
+    for entry in _walk(repo_path, exclude_spec, prune_names):
+        # 检查扩展名（与 Path.suffix 语义一致：忽略以点开头的隐藏文件名）
+        name = entry.name
+        dot = name.rfind(".")
+        if dot <= 0:
+            continue
+        ext = name[dot:]
+        if ext not in include_extensions:
+            # 扩展名大多已是小写，仅在未命中时再转换大小写
+            ext = ext.lower()
+            if ext not in include_extensions:
+                continue
+        
+        try:
+            size = entry.stat().st_size
+        except OSError as e:
+            logger.warning(f"无法获取文件信息 {entry.path}: {e}")
+            continue
+        
+        if size > max_file_size:
+            logger.warning(f"文件过大，跳过: {entry.path}")
+            continue
+        
+        yield entry.path, entry.path[prefix_len:], ext, size
+
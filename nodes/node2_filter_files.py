@@ -7,8 +7,6 @@
 import logging
 from pathlib import Path
 
-import pathspec
-
 from state import Repo2DocState, FileInfo
 from config_loader import Config
 
@@ -37,24 +35,17 @@ def filter_files(state: Repo2DocState, config: Config) -> Repo2DocState:
         logger.error(state["error"])
         return state
     
-    # 创建 pathspec 匹配器
-    exclude_patterns = config.file_filter.exclude_patterns
-    spec = pathspec.PathSpec.from_lines(
-        pathspec.patterns.GitWildMatchPattern,
-        exclude_patterns
-    )
+    # 获取 pathspec 匹配器（在配置对象上缓存）
+    spec = config.file_filter.compiled_spec
     
-    filtered_files: list[FileInfo] = []
-    excluded_count = 0
+    # 一次性批量匹配排除规则
+    excluded = set(spec.match_files(f.path for f in all_files))
+    if logger.isEnabledFor(logging.DEBUG):
+        for path in sorted(excluded):
+            logger.debug(f"排除文件: {path}")
     
-    for file_info in all_files:
-        # 检查是否匹配排除规则
-        if spec.match_file(file_info.path):
-            excluded_count += 1
-            logger.debug(f"排除文件: {file_info.path}")
-            continue
-        
-        filtered_files.append(file_info)
+    filtered_files: list[FileInfo] = [f for f in all_files if f.path not in excluded]
+    excluded_count = len(all_files) - len(filtered_files)
     
     # 限制最大文件数
     max_files = config.file_filter.max_files
@@ -8,6 +8,8 @@
 import logging
 import os
 from collections import defaultdict
+from operator import itemgetter
+from typing import Callable
 
 from state import Repo2DocState, FileInfo, CodeChunk
 from config_loader import Config
@@ -16,6 +18,18 @@ from utils.file_utils import format_file_for_prompt
 
 logger = logging.getLogger(__name__)
 
+# 重要的配置文件名（优先处理，已转为小写）
+_CONFIG_NAMES = frozenset(name.lower() for name in (
+    'package.json', 'pyproject.toml', 'setup.py', 'requirements.txt',
+    'pom.xml', 'build.gradle', 'go.mod', 'Cargo.toml',
+    'tsconfig.json', 'webpack.config.js', 'vite.config.js',
+    '.env.example', 'docker-compose.yml', 'Dockerfile',
+    'Makefile', 'CMakeLists.txt'
+))
+
+# 入口文件名模式（按优先级排列）
+_ENTRY_PATTERNS = ('__init__', 'index', 'main', 'app', 'mod', 'lib')
+
 
 def chunk_files(state: Repo2DocState, config: Config) -> Repo2DocState:
     """
@@ -84,7 +98,15 @@ def chunk_files(state: Repo2DocState, config: Config) -> Repo2DocState:
         chunks.append(chunk)
         logger.debug(f"创建块 {chunk_id + 1}: {len(current_chunk_files)} 个文件, {current_chunk_tokens:,} tokens")
     
+    # 文件内容已合并进各块，释放原始内容，降低 LLM 阶段的内存占用
+    for file_info in filtered_files:
+        file_info.content = ""
+    
     # 更新状态
+    state["all_files"] = []
+    # 按分块顺序重排路径与扩展名，使每个块对应其中连续的一段
+    state["file_paths"] = [f.path for f in sorted_files]
+    state["file_extensions"] = [f.extension for f in sorted_files]
     state["chunks"] = chunks
     state["total_chunks"] = len(chunks)
     state["current_chunk_index"] = 0
@@ -118,18 +140,11 @@ def _sort_files_by_priority(files: list[FileInfo]) -> list[FileInfo]:
     root_other_files = []      # 根目录其他文件
     module_files = defaultdict(list)  # 按模块分组的文件
     
-    # 重要的配置文件名（优先处理）
-    config_names = {
-        'package.json', 'pyproject.toml', 'setup.py', 'requirements.txt',
-        'pom.xml', 'build.gradle', 'go.mod', 'Cargo.toml',
-        'tsconfig.json', 'webpack.config.js', 'vite.config.js',
-        '.env.example', 'docker-compose.yml', 'Dockerfile',
-        'Makefile', 'CMakeLists.txt'
-    }
-    
     for file_info in files:
         path = file_info.path
-        parts = path.replace('\\', '/').split('/')
+        if os.sep != '/':
+            path = path.replace('\\', '/')
+        parts = path.split('/')
         filename = parts[-1].lower()
         
         # 判断是否是根目录文件
@@ -138,7 +153,7 @@ def _sort_files_by_priority(files: list[FileInfo]) -> list[FileInfo]:
         if is_root:
             if 'readme' in filename:
                 readme_files.append(file_info)
-            elif filename in {f.lower() for f in config_names}:
+            elif filename in _CONFIG_NAMES:
                 root_config_files.append(file_info)
             else:
                 root_other_files.append(file_info)
@@ -148,35 +163,34 @@ def _sort_files_by_priority(files: list[FileInfo]) -> list[FileInfo]:
             module_files[module_name].append(file_info)
     
     # 对每个模块内的文件排序（入口文件优先）
-    entry_patterns = ['__init__', 'index', 'main', 'app', 'mod', 'lib']
-    
     def file_priority(f: FileInfo) -> tuple:
         filename = os.path.basename(f.path).lower()
         name_without_ext = os.path.splitext(filename)[0]
         
         # 入口文件优先
-        for i, pattern in enumerate(entry_patterns):
-            if pattern in name_without_ext:
-                return (0, i, filename)
+        index = next(
+            (i for i, pattern in enumerate(_ENTRY_PATTERNS) if pattern in name_without_ext),
+            -1
+        )
+        if index >= 0:
+            return (0, index, filename)
         return (1, 0, filename)
     
     # 组合结果
     sorted_files = []
     
     # 1. README 文件
-    sorted_files.extend(sorted(readme_files, key=lambda f: f.path.lower()))
+    sorted_files.extend(_sort_decorated(readme_files, lambda f: f.path.lower()))
     
     # 2. 根目录配置文件
-    sorted_files.extend(sorted(root_config_files, key=lambda f: f.path.lower()))
+    sorted_files.extend(_sort_decorated(root_config_files, lambda f: f.path.lower()))
     
     # 3. 根目录其他文件
-    sorted_files.extend(sorted(root_other_files, key=file_priority))
+    sorted_files.extend(_sort_decorated(root_other_files, file_priority))
     
     # 4. 按模块分组的文件（模块名按字母排序）
     for module_name in sorted(module_files.keys()):
-        module_file_list = module_files[module_name]
-        module_file_list.sort(key=file_priority)
-        sorted_files.extend(module_file_list)
+        sorted_files.extend(_sort_decorated(module_files[module_name], file_priority))
     
     logger.info(f"文件排序完成:")
     logger.info(f"  README 文件: {len(readme_files)} 个")
@@ -187,6 +201,25 @@ def _sort_files_by_priority(files: list[FileInfo]) -> list[FileInfo]:
     return sorted_files
 
 
+def _sort_decorated(
+    files: list[FileInfo],
+    key: Callable[[FileInfo], tuple | str]
+) -> list[FileInfo]:
+    """
+    装饰-排序-去装饰：每个文件只计算一次排序键
+    
+    Args:
+        files: 文件列表
+        key: 排序键函数
+    
+    Returns:
+        排序后的新列表
+    """
+    decorated = [(key(f), f) for f in files]
+    decorated.sort(key=itemgetter(0))
+    return [f for _, f in decorated]
+
+
 def _create_chunk(chunk_id: int, files: list[FileInfo], token_count: int) -> CodeChunk:
     """
     创建代码块
@@ -199,17 +232,15 @@ def _create_chunk(chunk_id: int, files: list[FileInfo], token_count: int) -> Cod
     Returns:
         代码块对象
     """
-    # 合并文件内容
-    combined_parts = []
-    for file_info in files:
-        formatted = format_file_for_prompt(file_info.path, file_info.content)
-        combined_parts.append(formatted)
-    
-    combined_content = "\n\n" + "=" * 60 + "\n\n".join(combined_parts)
+    # 格式化文件内容（合并后的字符串在调用 LLM 时才拼接）
+    combined_parts = [
+        format_file_for_prompt(file_info.path, file_info.content)
+        for file_info in files
+    ]
     
     return CodeChunk(
         chunk_id=chunk_id,
         files=files,
-        combined_content=combined_content,
+        combined_parts=combined_parts,
         token_count=token_count,
     )
@@ -4,13 +4,16 @@
 使用 LLM 生成需求文档，支持增量式更新
 """
 
+import io
 import logging
+from typing import Optional
 
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage
 
 from state import Repo2DocState, CodeChunk
 from config_loader import Config
+from nodes.node5_save_output import save_intermediate_document
 
 
 logger = logging.getLogger(__name__)
@@ -24,6 +27,8 @@ def generate_doc(state: Repo2DocState, config: Config) -> Repo2DocState:
     1. 第一个块：使用系统提示 + 首次生成提示
     2. 后续块：使用增量更新提示 + 之前的文档
     
+    启用 parallel_summarize 时改为并行模式：并发生成各块摘要后一次性合并。
+    
     Args:
         state: 当前状态
         config: 配置对象
@@ -55,49 +60,59 @@ def generate_doc(state: Repo2DocState, config: Config) -> Repo2DocState:
         "calls": []
     })
     
-    # 逐块处理
-    for i, chunk in enumerate(chunks):
-        chunk_index = i + 1
-        total_chunks = len(chunks)
-        
-        logger.info(f"处理块 {chunk_index}/{total_chunks}...")
-        logger.info(f"  文件数: {len(chunk.files)}, Token 数: {chunk.token_count:,}")
-        
+    if config.llm.parallel_summarize and len(chunks) > 1:
+        # 并行模式：并发生成各块摘要，再合并为完整文档
         try:
-            if i == 0:
-                # 第一个块：使用系统提示
-                new_document, usage = _generate_first_chunk(
-                    llm, chunk, chunk_index, total_chunks, config
-                )
-            else:
-                # 后续块：增量更新
-                new_document, usage = _generate_next_chunk(
-                    llm, chunk, chunk_index, total_chunks, current_document, config
-                )
-            
-            # 记录 token 使用量
-            if usage:
-                llm_usage["total_prompt_tokens"] += usage.get("prompt_tokens", 0)
-                llm_usage["total_completion_tokens"] += usage.get("completion_tokens", 0)
-                llm_usage["total_tokens"] += usage.get("total_tokens", 0)
-                llm_usage["calls"].append({
-                    "chunk_index": chunk_index,
-                    "prompt_tokens": usage.get("prompt_tokens", 0),
-                    "completion_tokens": usage.get("completion_tokens", 0),
-                    "total_tokens": usage.get("total_tokens", 0)
-                })
-            
-            # 更新当前文档
-            current_document = new_document
-            intermediate_documents.append(new_document)
-            
-            logger.info(f"块 {chunk_index} 处理完成，文档长度: {len(new_document)} 字符")
-            
+            current_document, summaries = _generate_parallel(llm, chunks, config, llm_usage)
+            if config.output.save_intermediate:
+                for i, summary in enumerate(summaries):
+                    intermediate_documents.append(save_intermediate_document(
+                        state["repo_path"], config, i + 1, summary
+                    ))
         except Exception as e:
-            logger.error(f"处理块 {chunk_index} 时出错: {e}")
+            logger.error(f"并行生成文档时出错: {e}")
             state["status"] = "error"
-            state["error"] = f"处理块 {chunk_index} 时出错: {e}"
+            state["error"] = f"并行生成文档时出错: {e}"
             return state
+    else:
+        # 逐块处理（增量式）
+        for i, chunk in enumerate(chunks):
+            chunk_index = i + 1
+            total_chunks = len(chunks)
+            
+            logger.info(f"处理块 {chunk_index}/{total_chunks}...")
+            logger.info(f"  文件数: {len(chunk.files)}, Token 数: {chunk.token_count:,}")
+            
+            try:
+                if i == 0:
+                    # 第一个块：使用系统提示
+                    new_document, usage = _generate_first_chunk(
+                        llm, chunk, chunk_index, total_chunks, config
+                    )
+                else:
+                    # 后续块：增量更新
+                    new_document, usage = _generate_next_chunk(
+                        llm, chunk, chunk_index, total_chunks, current_document, config
+                    )
+                
+                # 记录 token 使用量
+                _record_usage(llm_usage, chunk_index, usage)
+                
+                # 更新当前文档
+                current_document = new_document
+                # 中间版本直接写入磁盘，状态中只保留路径
+                if config.output.save_intermediate:
+                    intermediate_documents.append(save_intermediate_document(
+                        state["repo_path"], config, chunk_index, new_document
+                    ))
+                
+                logger.info(f"块 {chunk_index} 处理完成，文档长度: {len(new_document)} 字符")
+                
+            except Exception as e:
+                logger.error(f"处理块 {chunk_index} 时出错: {e}")
+                state["status"] = "error"
+                state["error"] = f"处理块 {chunk_index} 时出错: {e}"
+                return state
     
     # 更新状态
     state["current_document"] = current_document
@@ -131,7 +146,11 @@ def _create_llm(config: Config) -> ChatOpenAI:
         kwargs["api_key"] = config.llm.api_key
     
     if config.llm.base_url:
+        # 许多兼容接口不支持流式返回 token 使用量，保持库的默认行为
         kwargs["base_url"] = config.llm.base_url
+    else:
+        # 官方接口流式输出时同样返回 token 使用量
+        kwargs["stream_usage"] = True
     
     return ChatOpenAI(**kwargs)
 
@@ -166,20 +185,8 @@ def _generate_first_chunk(
         ))
     ]
     
-    # 调用 LLM
-    response = llm.invoke(messages)
-    
-    # 提取 token 使用量
-    usage = {}
-    if hasattr(response, 'response_metadata') and response.response_metadata:
-        token_usage = response.response_metadata.get('token_usage', {})
-        usage = {
-            "prompt_tokens": token_usage.get('prompt_tokens', 0),
-            "completion_tokens": token_usage.get('completion_tokens', 0),
-            "total_tokens": token_usage.get('total_tokens', 0)
-        }
-    
-    return response.content, usage
+    # 调用 LLM（流式接收）
+    return _stream_response(llm, messages)
 
 
 def _generate_next_chunk(
@@ -216,10 +223,129 @@ def _generate_next_chunk(
         ))
     ]
     
-    # 调用 LLM
-    response = llm.invoke(messages)
+    # 调用 LLM（流式接收）
+    return _stream_response(llm, messages)
+
+
+def _generate_parallel(
+    llm: ChatOpenAI,
+    chunks: list[CodeChunk],
+    config: Config,
+    llm_usage: dict
+) -> tuple[str, list[str]]:
+    """
+    并行模式生成文档（map-reduce）
+    
+    1. map：并发为每个块生成独立的需求摘要（块之间无依赖）
+    2. reduce：一次调用将所有摘要合并为完整文档
+    
+    Args:
+        llm: LLM 客户端
+        chunks: 代码块列表
+        config: 配置对象
+        llm_usage: LLM 使用量统计（原地更新）
+    
+    Returns:
+        (合并后的文档, 各块摘要列表)
+    """
+    total_chunks = len(chunks)
+    
+    logger.info(
+        f"并行生成 {total_chunks} 个块的摘要"
+        f"（最大并发数: {config.llm.max_concurrency}）..."
+    )
+    
+    # 并发生成各块摘要
+    batch_messages = [
+        [
+            SystemMessage(content=config.prompts.system),
+            HumanMessage(content=config.prompts.summarize.format(
+                code_content=chunk.combined_content,
+                chunk_index=i + 1,
+                total_chunks=total_chunks,
+            ))
+        ]
+        for i, chunk in enumerate(chunks)
+    ]
+    responses = llm.batch(
+        batch_messages,
+        config={"max_concurrency": config.llm.max_concurrency},
+    )
+    
+    summaries = []
+    for i, response in enumerate(responses):
+        _record_usage(llm_usage, i + 1, _extract_usage(response))
+        summaries.append(response.content)
+        logger.info(f"块 {i + 1} 摘要完成，长度: {len(response.content)} 字符")
+    
+    # 合并所有摘要
+    logger.info("合并各块摘要...")
+    combined_summaries = "\n\n".join(
+        f"## 块 {i + 1} 摘要\n\n{summary}"
+        for i, summary in enumerate(summaries)
+    )
+    messages = [
+        SystemMessage(content=config.prompts.system),
+        HumanMessage(content=config.prompts.merge.format(
+            summaries=combined_summaries,
+            total_chunks=total_chunks,
+        ))
+    ]
+    document, usage = _stream_response(llm, messages)
+    _record_usage(llm_usage, None, usage)
+    
+    return document, summaries
+
+
+def _stream_response(llm: ChatOpenAI, messages: list) -> tuple[str, dict]:
+    """
+    以流式方式调用 LLM，边接收边写入缓冲区
+    
+    token 使用量取自合并后分片的 usage_metadata，没有时再读取 response_metadata。
+    
+    Args:
+        llm: LLM 客户端
+        messages: 消息列表
+    
+    Returns:
+        (完整响应内容, token使用量)
+    """
+    buffer = io.StringIO()
+    # 合并各分片的元数据（不含内容，内容写入缓冲区，避免反复拼接长字符串）
+    merged = None
+    
+    for chunk in llm.stream(messages):
+        buffer.write(chunk.content)
+        metadata_chunk = chunk.model_copy(update={"content": ""})
+        merged = metadata_chunk if merged is None else merged + metadata_chunk
     
-    # 提取 token 使用量
+    usage = {}
+    if merged is not None and merged.usage_metadata:
+        usage = {
+            "prompt_tokens": merged.usage_metadata.get("input_tokens", 0),
+            "completion_tokens": merged.usage_metadata.get("output_tokens", 0),
+            "total_tokens": merged.usage_metadata.get("total_tokens", 0)
+        }
+    elif merged is not None:
+        usage = _extract_usage(merged)
+    
+    if not usage.get("total_tokens"):
+        logger.warning("流式响应未返回 token 使用量，本次调用不计入 LLM 使用量统计")
+        usage = {}
+    
+    return buffer.getvalue(), usage
+
+
+def _extract_usage(response) -> dict:
+    """
+    提取 LLM 响应中的 token 使用量
+    
+    Args:
+        response: LLM 响应消息
+    
+    Returns:
+        token 使用量（无法获取时为空字典）
+    """
     usage = {}
     if hasattr(response, 'response_metadata') and response.response_metadata:
         token_usage = response.response_metadata.get('token_usage', {})
@@ -228,5 +354,27 @@ def _generate_next_chunk(
             "completion_tokens": token_usage.get('completion_tokens', 0),
             "total_tokens": token_usage.get('total_tokens', 0)
         }
+    return usage
+
+
+def _record_usage(llm_usage: dict, chunk_index: Optional[int], usage: dict) -> None:
+    """
+    累加一次 LLM 调用的 token 使用量
     
-    return response.content, usage
+    Args:
+        llm_usage: LLM 使用量统计（原地更新）
+        chunk_index: 块索引（合并调用为 None）
+        usage: 本次调用的 token 使用量
+    """
+    if not usage:
+        return
+    
+    llm_usage["total_prompt_tokens"] += usage.get("prompt_tokens", 0)
+    llm_usage["total_completion_tokens"] += usage.get("completion_tokens", 0)
+    llm_usage["total_tokens"] += usage.get("total_tokens", 0)
+    llm_usage["calls"].append({
+        "chunk_index": chunk_index,
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+        "total_tokens": usage.get("total_tokens", 0)
+    })
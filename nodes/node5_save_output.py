@@ -4,16 +4,70 @@
 将生成的文档保存到文件
 """
 
+import json
 import logging
-from pathlib import Path
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Union
 
 from state import Repo2DocState
 from config_loader import Config
+from utils.uring_writer import batch_write
 
 
 logger = logging.getLogger(__name__)
 
+# 回退到线程写入时的最大线程数
+_WRITE_WORKERS = 8
+
+# 写文件时使用的 os.open 标志（O_BINARY 仅 Windows 存在）
+_WRITE_FLAGS = (
+    os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+    | getattr(os, "O_CLOEXEC", 0) | getattr(os, "O_BINARY", 0)
+)
+
+# 报告开头（统计信息与文件类型分布标题）
+_REPORT_HEADER_TEMPLATE = (
+    "# Repo2Doc 处理报告\n"
+    "\n"
+    "**生成时间**: {generated_at}\n"
+    "**仓库路径**: {repo_path}\n"
+    "\n"
+    "## 统计信息\n"
+    "\n"
+    "- **总文件数**: {total_files}\n"
+    "- **筛选后文件数**: {filtered_count}\n"
+    "- **总 Token 数**: {total_tokens:,}\n"
+    "- **代码块数**: {chunk_count}\n"
+    "- **已处理块数**: {processed_chunks}\n"
+    "\n"
+    "## 文件类型分布\n"
+)
+
+# 代码块详情标题
+_REPORT_CHUNKS_SECTION = "\n## 代码块详情\n"
+
+# 报告结尾（配置信息）
+_REPORT_FOOTER_TEMPLATE = (
+    "## 配置信息\n"
+    "\n"
+    "- **LLM 模型**: {model}\n"
+    "- **最大输入 Token**: {max_input_tokens:,}\n"
+    "- **预留 Token**: {reserved_tokens:,}\n"
+    "- **最大文件大小**: {max_file_size:,} 字节\n"
+    "- **最大文件数**: {max_files}"
+)
+
+# 报告中单个代码块的详情模板（末尾换行对应块之间的空行）
+_CHUNK_TEMPLATE = (
+    "### 块 {index}\n"
+    "- **文件数**: {file_count}\n"
+    "- **Token 数**: {token_count:,}\n"
+    "- **包含文件**:{files}{more}\n"
+)
+
 
 def save_output(state: Repo2DocState, config: Config) -> Repo2DocState:
     """
@@ -36,49 +90,43 @@ def save_output(state: Repo2DocState, config: Config) -> Repo2DocState:
         logger.error(state["error"])
         return state
     
-    # 创建输出目录
-    repo_path = Path(state["repo_path"])
-    output_dir = repo_path / config.output.output_dir
-    output_dir.mkdir(parents=True, exist_ok=True)
+    # 创建输出目录（路径只拼接一次，后续按字符串构造文件名）
+    output_dir = os.path.normpath(os.path.join(state["repo_path"], config.output.output_dir))
+    os.makedirs(output_dir, exist_ok=True)
     
     # 生成时间戳
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     
-    # 保存最终文档
-    output_file = output_dir / config.output.filename
-    _save_file(output_file, current_document)
-    logger.info(f"最终文档已保存: {output_file}")
+    output_file = os.path.join(output_dir, config.output.filename)
+    backup_file = os.path.join(output_dir, f"{timestamp}_{config.output.filename}")
+    report_file = os.path.join(output_dir, f"{timestamp}_report.md")
+    stats_file = os.path.join(output_dir, f"{timestamp}_stats.json")
     
-    # 保存带时间戳的备份
-    backup_file = output_dir / f"{timestamp}_{config.output.filename}"
-    _save_file(backup_file, current_document)
-    logger.info(f"备份文档已保存: {backup_file}")
+    # 中间结果已在生成阶段逐块写入磁盘，这里只记录位置
+    intermediate_documents = state.get("intermediate_documents", [])
+    if intermediate_documents:
+        logger.info(f"中间结果已保存: {os.path.dirname(intermediate_documents[0])}")
     
-    # 保存中间结果（如果配置启用）
-    if config.output.save_intermediate:
-        intermediate_documents = state.get("intermediate_documents", [])
-        if intermediate_documents:
-            intermediate_dir = output_dir / "intermediate"
-            intermediate_dir.mkdir(parents=True, exist_ok=True)
-            
-            for i, doc in enumerate(intermediate_documents):
-                intermediate_file = intermediate_dir / f"chunk_{i + 1}.md"
-                _save_file(intermediate_file, doc)
-            
-            logger.info(f"中间结果已保存: {intermediate_dir}")
-    
-    # 保存处理报告
-    report = _generate_report(state, config)
-    report_file = output_dir / f"{timestamp}_report.md"
-    _save_file(report_file, report)
-    logger.info(f"处理报告已保存: {report_file}")
+    # 处理报告直接流式写入文件
+    _write_report(report_file, state, config)
     
-    # 保存 JSON 统计信息
+    # 生成 JSON 统计信息
     stats = _generate_stats_json(state, config, timestamp)
-    stats_file = output_dir / f"{timestamp}_stats.json"
-    import json
-    with open(stats_file, "w", encoding="utf-8") as f:
-        json.dump(stats, f, ensure_ascii=False, indent=2)
+    
+    # 收集所有输出文件，一次性批量写入（备份与最终文档内容相同，随后单独复制）
+    files = [
+        (output_file, current_document),
+        (stats_file, json.dumps(stats, ensure_ascii=False, indent=2)),
+    ]
+    if not batch_write(files):
+        # 无法使用 io_uring 时（非 Linux 等）用线程并发写入，write 期间会释放 GIL
+        with ThreadPoolExecutor(max_workers=min(_WRITE_WORKERS, len(files))) as executor:
+            list(executor.map(lambda item: _save_file(*item), files))
+    _clone_file(output_file, backup_file, current_document)
+    
+    logger.info(f"最终文档已保存: {output_file}")
+    logger.info(f"备份文档已保存: {backup_file}")
+    logger.info(f"处理报告已保存: {report_file}")
     logger.info(f"统计信息已保存: {stats_file}")
     
     # 更新状态
@@ -89,7 +137,39 @@ def save_output(state: Repo2DocState, config: Config) -> Repo2DocState:
     return state
 
 
-def _save_file(file_path: Path, content: str) -> None:
+def save_intermediate_document(
+    repo_path: str,
+    config: Config,
+    chunk_index: int,
+    document: str
+) -> str:
+    """
+    将单个中间文档立即写入磁盘
+    
+    生成阶段每产出一个版本就落盘，状态中只保留文件路径，
+    避免所有版本的完整文档同时驻留内存。
+    
+    Args:
+        repo_path: 仓库路径
+        config: 配置对象
+        chunk_index: 块索引（从 1 开始）
+        document: 文档内容
+    
+    Returns:
+        中间文档的文件路径
+    """
+    intermediate_dir = os.path.normpath(
+        os.path.join(repo_path, config.output.output_dir, "intermediate")
+    )
+    os.makedirs(intermediate_dir, exist_ok=True)
+    
+    intermediate_file = os.path.join(intermediate_dir, f"chunk_{chunk_index}.md")
+    _save_file(intermediate_file, document)
+    
+    return intermediate_file
+
+
+def _save_file(file_path: Union[str, os.PathLike], content: str) -> None:
     """
     保存文件
     
@@ -97,80 +177,116 @@ def _save_file(file_path: Path, content: str) -> None:
         file_path: 文件路径
         content: 文件内容
     """
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
+    data = memoryview(content.encode("utf-8"))
+    fd = os.open(file_path, _WRITE_FLAGS, 0o644)
+    try:
+        # 通常一次写完，短写入时继续写剩余部分
+        written = 0
+        while written < len(data):
+            written += os.write(fd, data[written:])
+    finally:
+        os.close(fd)
 
 
-def _generate_report(state: Repo2DocState, config: Config) -> str:
+def _clone_file(
+    src: Union[str, os.PathLike],
+    dst: Union[str, os.PathLike],
+    content: str
+) -> None:
     """
-    生成处理报告
+    将已写入的文件复制为新文件，避免再次写入相同内容
+    
+    Linux 上使用 copy_file_range 在内核中完成复制，支持 reflink 的文件系统
+    （btrfs、XFS 等）只需复制元数据；不支持时回退到重新写入。
+    不使用硬链接：下次运行截断重写最终文档时会连带破坏备份。
     
     Args:
+        src: 源文件路径
+        dst: 目标文件路径
+        content: 文件内容（无法复制时用于重新写入）
+    """
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            if remaining == 0:
+                return
+        except OSError as e:
+            logger.debug(f"copy_file_range 复制失败，回退到写入: {e}")
+    
+    _save_file(dst, content)
+
+
+def _write_report(
+    report_path: Union[str, os.PathLike],
+    state: Repo2DocState,
+    config: Config
+) -> None:
+    """
+    生成处理报告并直接写入文件
+    
+    逐段写入缓冲文件，不在内存中拼接完整报告。
+    
+    Args:
+        report_path: 报告文件路径
         state: 当前状态
         config: 配置对象
-    
-    Returns:
-        报告内容
     """
     chunks = state.get("chunks", [])
     filtered_files = state.get("filtered_files", [])
     
     # 统计文件类型
-    extension_counts = {}
-    for file_info in filtered_files:
-        ext = file_info.extension
-        extension_counts[ext] = extension_counts.get(ext, 0) + 1
-    
-    # 生成报告
-    report_lines = [
-        "# Repo2Doc 处理报告",
-        "",
-        f"**生成时间**: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-        f"**仓库路径**: {state['repo_path']}",
-        "",
-        "## 统计信息",
-        "",
-        f"- **总文件数**: {state.get('total_files', 0)}",
-        f"- **筛选后文件数**: {len(filtered_files)}",
-        f"- **总 Token 数**: {state.get('total_tokens', 0):,}",
-        f"- **代码块数**: {len(chunks)}",
-        f"- **已处理块数**: {state.get('processed_chunks', 0)}",
-        "",
-        "## 文件类型分布",
-        "",
-    ]
+    extension_counts = Counter(state.get("file_extensions", []))
     
-    for ext, count in sorted(extension_counts.items(), key=lambda x: -x[1]):
-        report_lines.append(f"- `{ext}`: {count} 个文件")
-    
-    report_lines.extend([
-        "",
-        "## 代码块详情",
-        "",
-    ])
-    
-    for i, chunk in enumerate(chunks):
-        report_lines.append(f"### 块 {i + 1}")
-        report_lines.append(f"- **文件数**: {len(chunk.files)}")
-        report_lines.append(f"- **Token 数**: {chunk.token_count:,}")
-        report_lines.append("- **包含文件**:")
-        for file_info in chunk.files[:10]:  # 只显示前 10 个
-            report_lines.append(f"  - `{file_info.path}`")
-        if len(chunk.files) > 10:
-            report_lines.append(f"  - ... 还有 {len(chunk.files) - 10} 个文件")
-        report_lines.append("")
-    
-    report_lines.extend([
-        "## 配置信息",
-        "",
-        f"- **LLM 模型**: {config.llm.model}",
-        f"- **最大输入 Token**: {config.llm.max_input_tokens:,}",
-        f"- **预留 Token**: {config.llm.reserved_tokens:,}",
-        f"- **最大文件大小**: {config.file_filter.max_file_size:,} 字节",
-        f"- **最大文件数**: {config.file_filter.max_files}",
-    ])
-    
-    return "\n".join(report_lines)
+    with open(report_path, "w", encoding="utf-8", newline="", buffering=1 << 20) as f:
+        # 固定内容来自模板，只填充可变部分
+        f.write(_REPORT_HEADER_TEMPLATE.format(
+            generated_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            repo_path=state['repo_path'],
+            total_files=state.get('total_files', 0),
+            filtered_count=len(filtered_files),
+            total_tokens=state.get('total_tokens', 0),
+            chunk_count=len(chunks),
+            processed_chunks=state.get('processed_chunks', 0),
+        ))
+        f.write("\n")
+        
+        for ext, count in extension_counts.most_common():
+            f.write(f"- `{ext}`: {count} 个文件\n")
+        
+        f.write(_REPORT_CHUNKS_SECTION)
+        f.write("\n")
+        
+        # 分块后 file_paths 按块顺序排列，每个块对应其中连续的一段
+        file_paths = state.get("file_paths", [])
+        offset = 0
+        for i, chunk in enumerate(chunks):
+            file_count = len(chunk.files)
+            # 只显示前 10 个
+            paths = file_paths[offset:offset + min(file_count, 10)]
+            more = f"\n  - ... 还有 {file_count - 10} 个文件" if file_count > 10 else ""
+            f.write(_CHUNK_TEMPLATE.format(
+                index=i + 1,
+                file_count=file_count,
+                token_count=chunk.token_count,
+                files="".join(f"\n  - `{path}`" for path in paths),
+                more=more,
+            ))
+            f.write("\n")
+            offset += file_count
+        
+        f.write(_REPORT_FOOTER_TEMPLATE.format(
+            model=config.llm.model,
+            max_input_tokens=config.llm.max_input_tokens,
+            reserved_tokens=config.llm.reserved_tokens,
+            max_file_size=config.file_filter.max_file_size,
+            max_files=config.file_filter.max_files,
+        ))
 
 
 def _generate_stats_json(state: Repo2DocState, config: Config, timestamp: str) -> dict:
@@ -190,10 +306,7 @@ def _generate_stats_json(state: Repo2DocState, config: Config, timestamp: str) -
     llm_usage = state.get("llm_usage", {})
     
     # 统计文件类型
-    extension_counts = {}
-    for file_info in filtered_files:
-        ext = file_info.extension
-        extension_counts[ext] = extension_counts.get(ext, 0) + 1
+    extension_counts = Counter(state.get("file_extensions", []))
     
     return {
         "meta": {
@@ -217,11 +330,11 @@ def _generate_stats_json(state: Repo2DocState, config: Config, timestamp: str) -
         "files": {
             "total_scanned": state.get("total_files", 0),
             "total_filtered": len(filtered_files),
-            "by_extension": extension_counts,
+            "by_extension": dict(extension_counts),
         },
         "document": {
             "final_length": len(state.get("current_document", "")),
-            "versions_count": len(state.get("intermediate_documents", [])),
+            "versions_count": state.get("processed_chunks", 0),
         },
         "config": {
             "model": config.llm.model,
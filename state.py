@@ -8,7 +8,7 @@ from typing import TypedDict, Optional
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class FileInfo:
     """文件信息"""
     path: str                    # 相对路径
@@ -19,13 +19,18 @@ class FileInfo:
     token_count: int = 0         # Token 数量
 
 
-@dataclass
+@dataclass(slots=True)
 class CodeChunk:
     """代码块"""
     chunk_id: int                # 块 ID
     files: list[FileInfo]        # 包含的文件列表
-    combined_content: str        # 合并后的内容
+    combined_parts: list[str]    # 各文件格式化后的内容
     token_count: int             # Token 数量
+    
+    @property
+    def combined_content(self) -> str:
+        """合并后的内容（按需拼接，不常驻内存）"""
+        return "\n\n" + "=" * 60 + "\n\n".join(self.combined_parts)
 
 
 class Repo2DocState(TypedDict):
@@ -42,6 +47,10 @@ class Repo2DocState(TypedDict):
     # 文件处理阶段
     all_files: list[FileInfo]               # 所有扫描到的文件
     filtered_files: list[FileInfo]          # 筛选后的文件
+    # 分块时写入：按块顺序拼接各 chunk.files 的路径，每个块对应其中连续的一段。
+    # 报告阶段据此按块切片，无需逐个访问 FileInfo 属性
+    file_paths: list[str]                   # 分块后文件的路径
+    file_extensions: list[str]              # 分块后文件的扩展名（与 file_paths 一一对应）
     
     # 分块阶段
     chunks: list[CodeChunk]                 # 代码块列表
@@ -50,7 +59,7 @@ class Repo2DocState(TypedDict):
     
     # 文档生成阶段
     current_document: str                   # 当前生成的文档
-    intermediate_documents: list[str]       # 中间文档列表（每个块生成后的版本）
+    intermediate_documents: list[str]       # 中间文档路径列表（每个块生成后的版本）
     
     # 状态信息
     status: str                             # 当前状态
@@ -81,6 +90,8 @@ def create_initial_state(repo_path: str, config_path: Optional[str] = None) -> R
         config_path=config_path,
         all_files=[],
         filtered_files=[],
+        file_paths=[],
+        file_extensions=[],
         chunks=[],
         current_chunk_index=0,
         total_chunks=0,
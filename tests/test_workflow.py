@@ -2,15 +2,58 @@
 工作流测试
 """
 
+import os
+
 import pytest
+import yaml
 from pathlib import Path
 from unittest.mock import Mock, patch
 
+from langchain_core.messages import AIMessage, AIMessageChunk
+
 from state import create_initial_state, Repo2DocState, FileInfo, CodeChunk
 from config_loader import Config, FileFilterConfig, LLMConfig, OutputConfig, LoggingConfig, PromptConfig
+from config_loader import _deep_merge
 from nodes.node1_scan_files import scan_files
 from nodes.node2_filter_files import filter_files
-from nodes.node3_chunk_files import chunk_files
+from nodes.node3_chunk_files import chunk_files, _sort_files_by_priority
+from nodes.node4_generate_doc import generate_doc, _create_llm
+from utils.file_utils import read_file_content, get_file_extension, is_text_file
+from utils.token_counter import count_tokens_batch
+from nodes.node5_save_output import save_output, _clone_file, _write_report
+from utils.uring_writer import batch_write
+
+
+def _fake_count_batch(texts, **kwargs):
+    """按字符数计算 token（测试环境无需加载 tiktoken 编码表）"""
+    return [len(text) for text in texts]
+
+
+class FakeLLM:
+    """记录调用的假 LLM 客户端"""
+    
+    def __init__(self):
+        self.prompts = []
+    
+    def invoke(self, messages):
+        self.prompts.append(messages[-1].content)
+        return AIMessage(
+            content=f"doc {len(self.prompts)}",
+            response_metadata={"token_usage": {
+                "prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15,
+            }},
+        )
+    
+    def batch(self, inputs, config=None):
+        return [self.invoke(messages) for messages in inputs]
+    
+    def stream(self, messages):
+        response = self.invoke(messages)
+        yield AIMessageChunk(content=response.content[:2])
+        yield AIMessageChunk(
+            content=response.content[2:],
+            usage_metadata={"input_tokens": 10, "output_tokens": 5, "total_tokens": 15},
+        )
 
 
 @pytest.fixture
@@ -96,13 +139,14 @@ class TestState:
         chunk = CodeChunk(
             chunk_id=0,
             files=[file_info],
-            combined_content="test content",
+            combined_parts=["test content"],
             token_count=100,
         )
         
         assert chunk.chunk_id == 0
         assert len(chunk.files) == 1
         assert chunk.token_count == 100
+        assert chunk.combined_content.endswith("test content")
 
 
 class TestConfig:
@@ -113,6 +157,54 @@ class TestConfig:
         assert mock_config.llm.model == "gpt-4o"
         assert mock_config.file_filter.max_file_size == 102400
         assert ".py" in mock_config.file_filter.include_extensions
+    
+    def test_env_cache(self, monkeypatch):
+        """测试环境变量缓存"""
+        Config.clear_env_cache()
+        monkeypatch.setenv("OPENAI_MODEL", "model-a")
+        assert Config.load().llm.model == "model-a"
+        
+        # 缓存生效期间不会重新读取环境变量
+        monkeypatch.setenv("OPENAI_MODEL", "model-b")
+        assert Config.load().llm.model == "model-a"
+        
+        Config.clear_env_cache()
+        assert Config.load().llm.model == "model-b"
+        Config.clear_env_cache()
+    
+    def test_yaml_cache(self, tmp_path):
+        """测试 YAML 配置解析缓存"""
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text(
+            "file_filter:\n  include_extensions: ['.py']\nllm:\n  temperature: 0.5\n",
+            encoding="utf-8",
+        )
+        
+        with patch("yaml.load", wraps=yaml.load) as loader:
+            first = Config.load(str(config_file))
+            first.file_filter.include_extensions.append(".xyz")
+            second = Config.load(str(config_file))
+            
+            assert loader.call_count == 1
+            assert second.llm.temperature == 0.5
+            assert second.file_filter.include_extensions == [".py"]
+            
+            # 修改文件后重新解析
+            config_file.write_text("llm:\n  temperature: 0.7\n", encoding="utf-8")
+            os.utime(config_file, ns=(0, config_file.stat().st_mtime_ns + 1))
+            assert Config.load(str(config_file)).llm.temperature == 0.7
+            assert loader.call_count == 2
+    
+    def test_deep_merge(self):
+        """测试配置深度合并"""
+        base = {"a": {"x": 1, "y": {"z": 2}}, "b": {"k": 1}, "c": 3}
+        override = {"a": {"y": {"z": 5}}, "c": 4, "d": 6}
+        
+        merged = _deep_merge(base, override)
+        
+        assert merged == {"a": {"x": 1, "y": {"z": 5}}, "b": {"k": 1}, "c": 4, "d": 6}
+        assert base == {"a": {"x": 1, "y": {"z": 2}}, "b": {"k": 1}, "c": 3}
+        assert _deep_merge(base, {}) is base
 
 
 class TestNodes:
@@ -126,6 +218,120 @@ class TestNodes:
         assert result["status"] == "error"
         assert "不存在" in result["error"]
     
+    def test_scan_files(self, mock_config, tmp_path):
+        """测试扫描目录"""
+        (tmp_path / "src").mkdir()
+        (tmp_path / "src" / "main.py").write_text("print('hello')", encoding="utf-8")
+        (tmp_path / "app.js").write_text("console.log(1)", encoding="utf-8")
+        (tmp_path / "readme.txt").write_text("ignored", encoding="utf-8")
+        (tmp_path / "LEGACY.PY").write_text("x", encoding="utf-8")
+        (tmp_path / ".py").write_text("hidden", encoding="utf-8")
+        
+        state = create_initial_state(str(tmp_path))
+        with patch("nodes.node1_scan_files.count_tokens_batch", side_effect=_fake_count_batch):
+            result = scan_files(state, mock_config)
+        
+        assert result["status"] == "scanned"
+        files = {Path(f.path).as_posix(): f for f in result["all_files"]}
+        assert set(files) == {"src/main.py", "app.js", "LEGACY.PY"}
+        assert files["LEGACY.PY"].extension == ".py"
+        assert files["src/main.py"].size == len("print('hello')")
+        assert files["src/main.py"].token_count == len("print('hello')")
+    
+    def test_count_tokens_batch_skips_trivial_texts(self):
+        """测试过小或过大的文本不调用编码器"""
+        encoder = Mock()
+        encoder.encode_ordinary_batch.side_effect = (
+            lambda texts, num_threads: [[0] * 7 for _ in texts]
+        )
+        texts = ["x = 1", "y" * 300, "z" * 3000]
+        
+        with patch("utils.token_counter.get_encoder", return_value=encoder), \
+                patch("utils.token_counter._DEFAULT_ENCODER", None):
+            counts = count_tokens_batch(texts, upper_bound=500)
+        
+        assert counts == [1, 7, 1800]
+        encoder.encode_ordinary_batch.assert_called_once()
+        assert encoder.encode_ordinary_batch.call_args[0][0] == ["y" * 300]
+    
+    def test_file_extension_matches_path_suffix(self):
+        """测试扩展名判断与 Path.suffix 一致"""
+        paths = [
+            "src/main.py", "src/MAIN.PY", ".py", "src/.bashrc",
+            "a.tar.gz", "Makefile", "pkg.d/run", "file.",
+        ]
+        
+        assert [get_file_extension(p) for p in paths] == [Path(p).suffix.lower() for p in paths]
+        assert [is_text_file(p) for p in paths] == [
+            True, True, False, False, False, False, False, False,
+        ]
+    
+    def test_read_file_content_encodings(self, tmp_path):
+        """测试读取不同编码的文件"""
+        (tmp_path / "utf8.py").write_bytes("# 中文注释\r\nx = 1\r\n".encode("utf-8"))
+        gbk_text = "# 这是一段用 GBK 编码保存的中文注释\nx = 1\n"
+        (tmp_path / "gbk.py").write_bytes(gbk_text.encode("gbk"))
+        
+        assert read_file_content(str(tmp_path / "utf8.py")) == "# 中文注释\nx = 1\n"
+        assert read_file_content(str(tmp_path / "gbk.py")) == gbk_text
+        assert read_file_content(str(tmp_path / "gbk.py"), max_size=4) is None
+    
+    def test_read_file_content_short_gbk(self, tmp_path):
+        """测试短 GBK 文件不会被编码检测误判"""
+        (tmp_path / "models.py").write_bytes("# 用户模块\nfrom .models import User\n".encode("gbk"))
+        (tmp_path / "short.py").write_bytes("# 中文\nx = 1\n".encode("gbk"))
+        
+        assert read_file_content(str(tmp_path / "models.py")) == (
+            "# 用户模块\nfrom .models import User\n"
+        )
+        assert read_file_content(str(tmp_path / "short.py")) == "# 中文\nx = 1\n"
+    
+    def test_scan_files_reuses_token_cache(self, mock_config, tmp_path):
+        """测试重复扫描时未变化的文件使用 token 缓存"""
+        (tmp_path / "a.py").write_text("print('a')", encoding="utf-8")
+        (tmp_path / "b.py").write_text("print('b')", encoding="utf-8")
+        
+        with patch(
+            "nodes.node1_scan_files.count_tokens_batch", side_effect=_fake_count_batch
+        ) as counter:
+            scan_files(create_initial_state(str(tmp_path)), mock_config)
+            (tmp_path / "b.py").write_text("print('changed')", encoding="utf-8")
+            result = scan_files(create_initial_state(str(tmp_path)), mock_config)
+        
+        assert counter.call_args_list[1][0][0] == ["print('changed')"]
+        assert {f.path: f.token_count for f in result["all_files"]} == {
+            "a.py": len("print('a')"), "b.py": len("print('changed')"),
+        }
+        assert (tmp_path / mock_config.output.output_dir / ".token_cache.json").exists()
+    
+    def test_scan_files_skips_oversized_without_reading(self, mock_config, tmp_path):
+        """测试超过大小限制的文件不会被读取"""
+        (tmp_path / "small.py").write_text("x = 1", encoding="utf-8")
+        (tmp_path / "large.py").write_text("x" * 200, encoding="utf-8")
+        mock_config.file_filter.max_file_size = 100
+        
+        state = create_initial_state(str(tmp_path))
+        with patch("nodes.node1_scan_files.count_tokens_batch", side_effect=_fake_count_batch), \
+                patch("nodes.node1_scan_files.read_file_content", return_value="x = 1") as reader:
+            result = scan_files(state, mock_config)
+        
+        assert [f.path for f in result["all_files"]] == ["small.py"]
+        assert reader.call_count == 1
+    
+    def test_scan_files_prunes_excluded_dirs(self, mock_config, tmp_path):
+        """测试扫描时跳过被排除的目录"""
+        (tmp_path / "node_modules" / "pkg").mkdir(parents=True)
+        (tmp_path / "node_modules" / "pkg" / "index.js").write_text("x", encoding="utf-8")
+        (tmp_path / "src" / "__pycache__").mkdir(parents=True)
+        (tmp_path / "src" / "__pycache__" / "cached.py").write_text("x", encoding="utf-8")
+        (tmp_path / "src" / "main.py").write_text("x", encoding="utf-8")
+        
+        state = create_initial_state(str(tmp_path))
+        with patch("nodes.node1_scan_files.count_tokens_batch", side_effect=_fake_count_batch):
+            result = scan_files(state, mock_config)
+        
+        assert [Path(f.path).as_posix() for f in result["all_files"]] == ["src/main.py"]
+    
     def test_filter_files_empty(self, mock_config):
         """测试筛选空文件列表"""
         state = create_initial_state("/tmp/repo")
@@ -136,6 +342,22 @@ class TestNodes:
         assert result["status"] == "error"
         assert "没有找到" in result["error"]
     
+    def test_filter_files(self, mock_config):
+        """测试按排除规则筛选文件"""
+        paths = ["src/b.py", "node_modules/pkg/index.js", "src/a.py", "src/__pycache__/a.py"]
+        state = create_initial_state("/tmp/repo")
+        state["all_files"] = [
+            FileInfo(path=p, absolute_path=p, content="", extension=".py", size=0, token_count=1)
+            for p in paths
+        ]
+        
+        result = filter_files(state, mock_config)
+        
+        assert result["status"] == "filtered"
+        assert [f.path for f in result["filtered_files"]] == ["src/a.py", "src/b.py"]
+        assert result["total_tokens"] == 2
+        assert mock_config.file_filter.compiled_spec is mock_config.file_filter.compiled_spec
+    
     def test_chunk_files_empty(self, mock_config):
         """测试分块空文件列表"""
         state = create_initial_state("/tmp/repo")
@@ -144,6 +366,181 @@ class TestNodes:
         result = chunk_files(state, mock_config)
         
         assert result["status"] == "error"
+    
+    def test_chunk_files_releases_content(self, mock_config):
+        """测试分块后释放原始文件内容"""
+        state = create_initial_state("/tmp/repo")
+        state["filtered_files"] = [
+            FileInfo(
+                path=p, absolute_path=p, content=f"code of {p}",
+                extension=".py", size=0, token_count=5,
+            )
+            for p in ["main.py", "src/a.py"]
+        ]
+        state["all_files"] = list(state["filtered_files"])
+        
+        result = chunk_files(state, mock_config)
+        
+        assert result["status"] == "chunked"
+        assert "code of src/a.py" in result["chunks"][0].combined_content
+        assert all(f.content == "" for f in result["filtered_files"])
+        assert result["file_paths"] == [f.path for f in result["chunks"][0].files]
+        assert result["all_files"] == []
+    
+    def test_sort_files_by_priority(self):
+        """测试文件优先级排序"""
+        paths = [
+            "src/utils.py", "src/main.py", "src/__init__.py",
+            "lib/b.py", "tool.py", "setup.py", "README.md",
+        ]
+        files = [
+            FileInfo(path=p, absolute_path=p, content="", extension=".py", size=0)
+            for p in paths
+        ]
+        
+        result = [f.path for f in _sort_files_by_priority(files)]
+        
+        assert result == [
+            "README.md", "setup.py", "tool.py",
+            "lib/b.py", "src/__init__.py", "src/main.py", "src/utils.py",
+        ]
+    
+    def _chunked_state(self, count, repo_path="/tmp/repo"):
+        """创建包含指定数量代码块的状态"""
+        state = create_initial_state(str(repo_path))
+        state["chunks"] = [
+            CodeChunk(chunk_id=i, files=[], combined_parts=[f"code {i}"], token_count=1)
+            for i in range(count)
+        ]
+        return state
+    
+    def test_generate_doc_incremental(self, mock_config, tmp_path):
+        """测试增量式生成文档"""
+        llm = FakeLLM()
+        with patch("nodes.node4_generate_doc._create_llm", return_value=llm):
+            result = generate_doc(self._chunked_state(3, tmp_path), mock_config)
+        
+        assert result["status"] == "generated"
+        assert result["current_document"] == "doc 3"
+        assert [Path(p).read_text(encoding="utf-8") for p in result["intermediate_documents"]] == [
+            "doc 1", "doc 2", "doc 3",
+        ]
+        assert result["intermediate_documents"][0] == str(
+            tmp_path / "repo2doc-output" / "intermediate" / "chunk_1.md"
+        )
+        assert result["llm_usage"]["total_tokens"] == 45
+    
+    def test_generate_doc_without_intermediate(self, mock_config, tmp_path):
+        """测试关闭中间结果时不保留中间文档"""
+        mock_config.output.save_intermediate = False
+        
+        llm = FakeLLM()
+        with patch("nodes.node4_generate_doc._create_llm", return_value=llm):
+            result = generate_doc(self._chunked_state(3, tmp_path), mock_config)
+        
+        assert result["current_document"] == "doc 3"
+        assert result["intermediate_documents"] == []
+        assert not (tmp_path / mock_config.output.output_dir).exists()
+    
+    def test_create_llm_stream_usage(self, mock_config):
+        """测试仅在官方接口上强制开启流式 token 使用量"""
+        mock_config.llm.api_key = "test-key"
+        assert _create_llm(mock_config).stream_usage is True
+        
+        mock_config.llm.base_url = "https://example.com/v1"
+        assert _create_llm(mock_config).stream_usage is not True
+    
+    def test_generate_doc_warns_without_usage(self, mock_config, tmp_path, caplog):
+        """测试流式响应没有 token 使用量时记录警告"""
+        llm = FakeLLM()
+        llm.stream = lambda messages: iter([AIMessageChunk(content="doc")])
+        with patch("nodes.node4_generate_doc._create_llm", return_value=llm):
+            result = generate_doc(self._chunked_state(1, tmp_path), mock_config)
+        
+        assert result["current_document"] == "doc"
+        assert result["llm_usage"]["calls"] == []
+        assert "未返回 token 使用量" in caplog.text
+    
+    def test_generate_doc_parallel(self, mock_config, tmp_path):
+        """测试并行模式生成文档"""
+        mock_config.llm.parallel_summarize = True
+        mock_config.prompts.summarize = "summarize {chunk_index}/{total_chunks}: {code_content}"
+        mock_config.prompts.merge = "merge {total_chunks}: {summaries}"
+        
+        llm = FakeLLM()
+        with patch("nodes.node4_generate_doc._create_llm", return_value=llm):
+            result = generate_doc(self._chunked_state(3, tmp_path), mock_config)
+        
+        assert result["status"] == "generated"
+        assert [Path(p).read_text(encoding="utf-8") for p in result["intermediate_documents"]] == [
+            "doc 1", "doc 2", "doc 3",
+        ]
+        assert result["current_document"] == "doc 4"
+        assert llm.prompts[0].startswith("summarize 1/3:")
+        assert llm.prompts[-1].startswith("merge 3:")
+        assert "doc 2" in llm.prompts[-1]
+        assert len(result["llm_usage"]["calls"]) == 4
+    
+    @pytest.mark.parametrize("batched", [True, False])
+    def test_save_output(self, mock_config, tmp_path, batched):
+        """测试保存输出文件（批量写入与逐个写入）"""
+        state = create_initial_state(str(tmp_path))
+        state["current_document"] = "# 需求文档\n"
+        state["processed_chunks"] = 1
+        
+        writer = batch_write if batched else (lambda files: False)
+        with patch("nodes.node5_save_output.batch_write", side_effect=writer):
+            result = save_output(state, mock_config)
+        
+        output_dir = tmp_path / mock_config.output.output_dir
+        assert result["status"] == "completed"
+        assert (output_dir / "requirements.md").read_text(encoding="utf-8") == "# 需求文档\n"
+        backups = list(output_dir.glob("*_requirements.md"))
+        assert [b.read_text(encoding="utf-8") for b in backups] == ["# 需求文档\n"]
+        assert os.stat(backups[0]).st_ino != os.stat(output_dir / "requirements.md").st_ino
+        assert len(list(output_dir.glob("*_report.md"))) == 1
+        assert len(list(output_dir.glob("*_stats.json"))) == 1
+    
+    def test_clone_file_fallback(self, tmp_path):
+        """测试无法在内核中复制时回退到写入"""
+        src = tmp_path / "src.md"
+        src.write_text("内容", encoding="utf-8")
+        
+        with patch("os.copy_file_range", side_effect=OSError("unsupported"), create=True):
+            _clone_file(src, tmp_path / "dst.md", "内容")
+        
+        assert (tmp_path / "dst.md").read_text(encoding="utf-8") == "内容"
+    
+    def test_write_report(self, mock_config, tmp_path):
+        """测试处理报告中的代码块详情"""
+        files = [
+            FileInfo(path=f"src/f{i}.py", absolute_path="", content="", extension=".py", size=0)
+            for i in range(12)
+        ]
+        state = create_initial_state("/tmp/repo")
+        state["filtered_files"] = files
+        state["file_paths"] = [f.path for f in files]
+        state["file_extensions"] = [f.extension for f in files]
+        state["chunks"] = [CodeChunk(chunk_id=0, files=files, combined_parts=[], token_count=1234)]
+        
+        _write_report(tmp_path / "report.md", state, mock_config)
+        report = (tmp_path / "report.md").read_text(encoding="utf-8")
+        
+        assert "- `.py`: 12 个文件" in report
+        assert (
+            "### 块 1\n- **文件数**: 12\n- **Token 数**: 1,234\n- **包含文件**:\n  - `src/f0.py`\n"
+        ) in report
+        assert "  - `src/f9.py`\n  - ... 还有 2 个文件\n\n## 配置信息" in report
+    
+    def test_batch_write(self, tmp_path):
+        """测试批量写入多个文件"""
+        files = [(str(tmp_path / f"{i}.md"), f"内容 {i}" * 1000) for i in range(5)]
+        
+        if not batch_write(files):
+            pytest.skip("io_uring 不可用")
+        
+        for path, content in files:
+            assert Path(path).read_text(encoding="utf-8") == content
 
 
 if __name__ == "__main__":
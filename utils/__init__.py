@@ -2,12 +2,15 @@
 Repo2Doc 工具函数模块
 """
 
-from utils.token_counter import count_tokens, estimate_tokens
+from utils.token_counter import count_tokens, count_tokens_batch, estimate_tokens
 from utils.file_utils import read_file_content, format_file_for_prompt
+from utils.uring_writer import batch_write
 
 __all__ = [
     "count_tokens",
+    "count_tokens_batch",
     "estimate_tokens",
     "read_file_content",
     "format_file_for_prompt",
+    "batch_write",
 ]
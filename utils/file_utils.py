@@ -4,8 +4,9 @@
 提供文件读取、格式化等功能
 """
 
+import io
 import logging
-from pathlib import Path
+import os
 from typing import Optional
 
 
@@ -14,6 +15,24 @@ logger = logging.getLogger(__name__)
 # 文件分隔符（类似 swark 的设计）
 FILE_SEPARATOR = "\n" + "=" * 60 + "\n"
 
+# 文件内容上下的分隔线
+_DASH40 = "-" * 40
+
+# 文本文件扩展名
+_TEXT_EXTENSIONS: frozenset[str] = frozenset({
+    ".py", ".js", ".jsx", ".ts", ".tsx", ".java", ".go", ".rs",
+    ".cpp", ".c", ".h", ".hpp", ".cs", ".rb", ".php", ".swift",
+    ".kt", ".scala", ".vue", ".svelte", ".html", ".css", ".scss",
+    ".json", ".yaml", ".yml", ".toml", ".xml", ".md", ".txt",
+    ".sh", ".bash", ".zsh", ".fish", ".ps1", ".bat", ".cmd",
+})
+
+# 供 str.endswith 使用的扩展名元组
+_TEXT_EXT_TUPLE = tuple(_TEXT_EXTENSIONS)
+
+# 读取文件时使用的 os.open 标志（O_BINARY 仅 Windows 存在）
+_READ_FLAGS = os.O_RDONLY | getattr(os, "O_CLOEXEC", 0) | getattr(os, "O_BINARY", 0)
+
 
 def read_file_content(file_path: str, max_size: int = 102400) -> Optional[str]:
     """
@@ -27,30 +46,97 @@ def read_file_content(file_path: str, max_size: int = 102400) -> Optional[str]:
         文件内容，如果读取失败返回 None
     """
     try:
-        path = Path(file_path)
+        # 打开一次，基于同一个 fd 检查大小并读取
+        fd = os.open(file_path, _READ_FLAGS)
+        try:
+            size = os.fstat(fd).st_size
+            
+            # 检查文件大小
+            if size > max_size:
+                logger.warning(f"文件过大，跳过: {file_path}")
+                return None
+            
+            raw = _read_all(fd, size)
+        finally:
+            os.close(fd)
         
-        # 检查文件大小
-        if path.stat().st_size > max_size:
-            logger.warning(f"文件过大，跳过: {file_path}")
-            return None
-        
-        # 尝试多种编码读取
-        encodings = ["utf-8", "gbk", "latin-1"]
-        for encoding in encodings:
-            try:
-                with open(path, "r", encoding=encoding) as f:
-                    return f.read()
-            except UnicodeDecodeError:
-                continue
-        
-        logger.warning(f"无法解码文件: {file_path}")
-        return None
+        # 在内存中尝试解码
+        return _decode(raw)
         
     except Exception as e:
         logger.error(f"读取文件失败 {file_path}: {e}")
         return None
 
 
+def _read_all(fd: int, size: int) -> bytes:
+    """
+    从 fd 读取指定字节数（文件在读取期间变短时读到末尾为止）
+    
+    Args:
+        fd: 文件描述符
+        size: 要读取的字节数
+    
+    Returns:
+        读取到的字节
+    """
+    data = os.read(fd, size)
+    if len(data) >= size or not data:
+        return data
+    
+    parts = [data]
+    remaining = size - len(data)
+    while remaining > 0:
+        data = os.read(fd, remaining)
+        if not data:
+            break
+        parts.append(data)
+        remaining -= len(data)
+    return b"".join(parts)
+
+
+def _decode(raw: bytes) -> str:
+    """
+    解码文件内容
+    
+    依次尝试 UTF-8、GBK、编码检测结果（需安装 charset-normalizer），
+    均失败时按 UTF-8 解码并替换无法识别的字节。
+    编码检测对短文本不可靠（常把 GBK 误判为 big5 等），因此只作为兜底。
+    换行符统一为 "\n"，与文本模式读取的结果一致。
+    
+    Args:
+        raw: 文件的原始字节
+    
+    Returns:
+        解码后的文本
+    """
+    for encoding in ("utf-8", "gbk"):
+        try:
+            text = raw.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        text = None
+        
+        # 仅在需要编码检测时导入，避免每次启动都加载 charset-normalizer
+        try:
+            import charset_normalizer
+        except ImportError:
+            charset_normalizer = None
+        
+        if charset_normalizer is not None:
+            best = charset_normalizer.from_bytes(raw).best()
+            if best is not None:
+                text = str(best)
+        
+        if text is None:
+            text = raw.decode("utf-8", errors="replace")
+    
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
 def format_file_for_prompt(file_path: str, content: str) -> str:
     """
     格式化文件内容用于 prompt
@@ -70,10 +156,7 @@ def format_file_for_prompt(file_path: str, content: str) -> str:
     Returns:
         格式化后的字符串
     """
-    header = f"文件路径: {file_path}"
-    separator = "-" * 40
-    
-    return f"{header}\n{separator}\n{content}\n{separator}"
+    return f"文件路径: {file_path}\n{_DASH40}\n{content}\n{_DASH40}"
 
 
 def combine_files_for_prompt(files: list[tuple[str, str]]) -> str:
@@ -86,12 +169,21 @@ def combine_files_for_prompt(files: list[tuple[str, str]]) -> str:
     Returns:
         合并后的字符串
     """
-    formatted_files = [
-        format_file_for_prompt(path, content)
-        for path, content in files
-    ]
+    # 直接写入缓冲区，不为每个文件生成中间字符串
+    buffer = io.StringIO()
+    for i, (path, content) in enumerate(files):
+        if i:
+            buffer.write(FILE_SEPARATOR)
+        buffer.write("文件路径: ")
+        buffer.write(path)
+        buffer.write("\n")
+        buffer.write(_DASH40)
+        buffer.write("\n")
+        buffer.write(content)
+        buffer.write("\n")
+        buffer.write(_DASH40)
     
-    return FILE_SEPARATOR.join(formatted_files)
+    return buffer.getvalue()
 
 
 def get_file_extension(file_path: str) -> str:
@@ -104,7 +196,12 @@ def get_file_extension(file_path: str) -> str:
     Returns:
         文件扩展名（包含点号，如 ".py"）
     """
-    return Path(file_path).suffix.lower()
+    # 与 Path.suffix 语义一致：只看最后一段路径，忽略以点开头或以点结尾的文件名
+    name_start = max(file_path.rfind("/"), file_path.rfind(os.sep)) + 1
+    dot = file_path.rfind(".")
+    if dot <= name_start or dot == len(file_path) - 1:
+        return ""
+    return file_path[dot:].lower()
 
 
 def is_text_file(file_path: str) -> bool:
@@ -117,13 +214,8 @@ def is_text_file(file_path: str) -> bool:
     Returns:
         是否为文本文件
     """
-    text_extensions = {
-        ".py", ".js", ".jsx", ".ts", ".tsx", ".java", ".go", ".rs",
-        ".cpp", ".c", ".h", ".hpp", ".cs", ".rb", ".php", ".swift",
-        ".kt", ".scala", ".vue", ".svelte", ".html", ".css", ".scss",
-        ".json", ".yaml", ".yml", ".toml", ".xml", ".md", ".txt",
-        ".sh", ".bash", ".zsh", ".fish", ".ps1", ".bat", ".cmd",
-    }
-    
-    ext = get_file_extension(file_path)
-    return ext in text_extensions
+    lowered = file_path.lower()
+    if not lowered.endswith(_TEXT_EXT_TUPLE):
+        return False
+    # 排除 ".py" 这类以点开头的隐藏文件名
+    return get_file_extension(lowered) != ""
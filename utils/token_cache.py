@@ -0,0 +1,106 @@
+"""
+Token 计数缓存
+
+按文件内容哈希持久化 token 数，重复运行时跳过未变化文件的编码
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+logger = logging.getLogger(__name__)
+
+# 缓存文件名（位于输出目录下）
+TOKEN_CACHE_FILENAME = ".token_cache.json"
+
+
+def content_hash(content: str) -> str:
+    """
+    计算文件内容的哈希值（安装 xxhash 时使用更快的 xxh64）
+    
+    Args:
+        content: 文件内容
+    
+    Returns:
+        十六进制哈希字符串
+    """
+    data = content.encode("utf-8", "ignore")
+    if xxhash is not None:
+        return xxhash.xxh64(data).hexdigest()
+    return hashlib.sha1(data).hexdigest()
+
+
+def load_token_cache(cache_path: Path, repo_path: str, upper_bound: int) -> dict[str, int]:
+    """
+    读取指定仓库的 token 缓存
+    
+    计数上限变化后，超限文件的估算结果不再有效，此时丢弃该仓库的缓存。
+    
+    Args:
+        cache_path: 缓存文件路径
+        repo_path: 仓库路径（缓存按仓库分组）
+        upper_bound: 计数时使用的 token 上限
+    
+    Returns:
+        {内容哈希: token 数}，缓存不存在或无效时为空字典
+    """
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"无法读取 token 缓存 {cache_path}: {e}")
+        return {}
+    
+    entry = data.get(repo_path) if isinstance(data, dict) else None
+    if not isinstance(entry, dict) or entry.get("upper_bound") != upper_bound:
+        return {}
+    return dict(entry.get("tokens", {}))
+
+
+def save_token_cache(
+    cache_path: Path,
+    repo_path: str,
+    upper_bound: int,
+    tokens: dict[str, int]
+) -> None:
+    """
+    原子地写回指定仓库的 token 缓存，保留其他仓库的条目
+    
+    Args:
+        cache_path: 缓存文件路径
+        repo_path: 仓库路径
+        upper_bound: 计数时使用的 token 上限
+        tokens: {内容哈希: token 数}
+    """
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            data = {}
+    except (OSError, ValueError):
+        data = {}
+    
+    data[repo_path] = {"upper_bound": upper_bound, "tokens": tokens}
+    
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"无法写入 token 缓存 {cache_path}: {e}")
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
@@ -5,9 +5,12 @@ Token 计数工具
 """
 
 import logging
+import os
 from functools import lru_cache
+from typing import Optional, TYPE_CHECKING
 
-import tiktoken
+if TYPE_CHECKING:
+    import tiktoken
 
 
 logger = logging.getLogger(__name__)
@@ -15,28 +18,64 @@ logger = logging.getLogger(__name__)
 # 默认编码器（GPT-4 使用 cl100k_base）
 DEFAULT_ENCODING = "cl100k_base"
 
+# 估算值低于该数量时不再精确计数（对分块结果没有影响）
+_MIN_EXACT_TOKENS = 16
+
+# 默认编码器实例（首次使用时创建，之后跳过 lru_cache 的查找）
+_DEFAULT_ENCODER: Optional["tiktoken.Encoding"] = None
+
 
 @lru_cache(maxsize=1)
-def get_encoder(encoding_name: str = DEFAULT_ENCODING) -> tiktoken.Encoding:
+def get_encoder(encoding_name: str = DEFAULT_ENCODING) -> "tiktoken.Encoding":
     """
     获取 tiktoken 编码器（带缓存）
     
+    首次调用时才导入 tiktoken，仅使用 estimate_tokens 时无需加载。
+    
     Args:
         encoding_name: 编码器名称
     
     Returns:
         tiktoken 编码器
     """
+    import tiktoken
+    
     return tiktoken.get_encoding(encoding_name)
 
 
-def count_tokens(text: str, encoding_name: str = DEFAULT_ENCODING) -> int:
+def _encoder_for(encoding_name: str) -> "tiktoken.Encoding":
+    """
+    获取编码器，默认编码直接使用模块级实例
+    
+    Args:
+        encoding_name: 编码器名称
+    
+    Returns:
+        tiktoken 编码器
+    """
+    global _DEFAULT_ENCODER
+    
+    if encoding_name != DEFAULT_ENCODING:
+        return get_encoder(encoding_name)
+    if _DEFAULT_ENCODER is None:
+        _DEFAULT_ENCODER = get_encoder(encoding_name)
+    return _DEFAULT_ENCODER
+
+
+def count_tokens(
+    text: str,
+    encoding_name: str = DEFAULT_ENCODING,
+    upper_bound: Optional[int] = None
+) -> int:
     """
     计算文本的 token 数量
     
+    估算值过小或超过 upper_bound 时直接返回估算结果，不影响分块决策，无需运行 BPE 编码。
+    
     Args:
         text: 要计算的文本
         encoding_name: 编码器名称
+        upper_bound: token 数上限（可选），估算值超过该值时视为过大
     
     Returns:
         token 数量
@@ -44,17 +83,78 @@ def count_tokens(text: str, encoding_name: str = DEFAULT_ENCODING) -> int:
     if not text:
         return 0
     
-    encoder = get_encoder(encoding_name)
-    return len(encoder.encode(text))
+    estimate = _gated_estimate(text, upper_bound)
+    if estimate is not None:
+        return estimate
+    
+    encoder = _encoder_for(encoding_name)
+    return len(encoder.encode_ordinary(text))
+
+
+def count_tokens_batch(
+    texts: list[str],
+    encoding_name: str = DEFAULT_ENCODING,
+    upper_bound: Optional[int] = None
+) -> list[int]:
+    """
+    批量计算多个文本的 token 数量
+    
+    使用 tiktoken 的批量接口，在 Rust 端多线程并行编码（释放 GIL）。
+    按普通文本编码，源码中出现的特殊 token 字面量（如 <|endoftext|>）不会报错。
+    估算值过小或超过 upper_bound 的文本直接使用估算结果，不参与编码。
+    
+    Args:
+        texts: 要计算的文本列表
+        encoding_name: 编码器名称
+        upper_bound: token 数上限（可选），估算值超过该值时视为过大
+    
+    Returns:
+        每个文本的 token 数量，顺序与输入一致
+    """
+    if not texts:
+        return []
+    
+    counts = [_gated_estimate(text, upper_bound) for text in texts]
+    pending = [i for i, count in enumerate(counts) if count is None]
+    
+    if pending:
+        encoder = _encoder_for(encoding_name)
+        encoded = encoder.encode_ordinary_batch(
+            [texts[i] for i in pending], num_threads=os.cpu_count() or 1
+        )
+        for i, tokens in zip(pending, encoded):
+            counts[i] = len(tokens)
+    
+    return counts
+
+
+def _gated_estimate(text: str, upper_bound: Optional[int] = None) -> Optional[int]:
+    """
+    判断是否可以跳过精确计数
+    
+    Args:
+        text: 要计算的文本
+        upper_bound: token 数上限（可选）
+    
+    Returns:
+        可直接使用的 token 数；需要精确计数时返回 None
+    """
+    estimate = estimate_tokens(text)
+    if estimate < _MIN_EXACT_TOKENS:
+        return estimate
+    if upper_bound is not None and estimate > upper_bound:
+        # 按两倍估算，确保过大的文件不会被误放入普通块
+        return estimate * 2
+    return None
 
 
 def estimate_tokens(text: str) -> int:
     """
     快速估算 token 数量（不使用 tiktoken，用于快速估算）
     
-    规则：
-    - 英文：约 4 个字符 = 1 token
-    - 中文：约 1.5 个字符 = 1 token
+    按 UTF-8 字节数估算：cl100k 编码下约 0.3 token / 字节。
+    英文（1 字节/字符）与中文（3 字节/字符）都能得到较接近的结果，
+    比按字符数估算更少低估中文、高估英文代码。
     
     Args:
         text: 要估算的文本
@@ -65,8 +165,7 @@ def estimate_tokens(text: str) -> int:
     if not text:
         return 0
     
-    # 简单估算：字符数 / 3
-    return len(text) // 3
+    return len(text.encode("utf-8", errors="ignore")) * 3 // 10
 
 
 def tokens_to_chars(tokens: int) -> int:
@@ -0,0 +1,185 @@
+"""
+批量写文件工具
+
+Linux 上使用 io_uring 将多个文件的写入合并为一次提交，减少系统调用次数；
+非 Linux 平台或未安装 liburing 时不可用，由调用方回退到逐个写入
+"""
+
+import logging
+import os
+import sys
+from typing import Optional
+
+
+logger = logging.getLogger(__name__)
+
+if sys.platform == "linux":
+    try:
+        import liburing
+    except ImportError:
+        liburing = None
+else:
+    liburing = None
+
+# 队列深度在文件数之外额外预留的条目数
+_QUEUE_PADDING = 8
+
+# 打开待写入文件时使用的 os.open 标志
+_OPEN_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC
+
+
+def batch_write(files: list[tuple[str, str]]) -> bool:
+    """
+    使用 io_uring 一次性提交多个文件的写入
+    
+    Args:
+        files: (文件路径, 文件内容) 列表，内容按 UTF-8 编码写入
+    
+    Returns:
+        是否已完成写入（False 表示 io_uring 不可用，调用方需自行写入）
+    """
+    if liburing is None or not files:
+        return False
+    
+    ring = liburing.Ring()
+    try:
+        liburing.io_uring_queue_init(len(files) + _QUEUE_PADDING, ring)
+    except OSError as e:
+        # 容器等环境可能禁用 io_uring
+        logger.debug(f"io_uring 初始化失败，回退到逐个写入: {e}")
+        return False
+    
+    paths = [path for path, _ in files]
+    # 编码后的数据直接注册为固定缓冲区，无需再复制到额外的缓冲池
+    buffers = [content.encode("utf-8") for _, content in files]
+    fds: list[int] = []
+    try:
+        for path in paths:
+            fds.append(os.open(path, _OPEN_FLAGS, 0o644))
+        
+        # 注册文件与缓冲区后，每次写入无需查找 fd 表和锁定用户页
+        registered = _register(ring, fds, buffers)
+        targets = list(range(len(fds))) if registered else fds
+        
+        for i, (target, buffer) in enumerate(zip(targets, buffers)):
+            _prep_write(
+                ring, i, target, buffer, 0,
+                fixed=registered, buf_index=i if registered else None
+            )
+        _wait_all(ring, paths, targets, buffers, fixed=registered)
+    finally:
+        for fd in fds:
+            os.close(fd)
+        liburing.io_uring_queue_exit(ring)
+    
+    return True
+
+
+def _register(ring, fds: list[int], buffers: list[bytes]) -> bool:
+    """
+    向 io_uring 注册文件描述符和数据缓冲区
+    
+    注册失败（例如超出锁定内存限制）时仍可使用普通写入，不视为错误。
+    
+    Args:
+        ring: io_uring 实例
+        fds: 文件描述符列表
+        buffers: 数据列表
+    
+    Returns:
+        是否注册成功
+    """
+    try:
+        liburing.io_uring_register_files(ring, liburing.FileIndex(fds))
+    except OSError as e:
+        logger.debug(f"注册文件失败，使用普通写入: {e}")
+        return False
+    
+    try:
+        liburing.io_uring_register_buffers(ring, liburing.Iovec(buffers))
+    except OSError as e:
+        logger.debug(f"注册缓冲区失败，使用普通写入: {e}")
+        liburing.io_uring_unregister_files(ring)
+        return False
+    
+    return True
+
+
+def _prep_write(
+    ring,
+    index: int,
+    target: int,
+    buffer: bytes,
+    offset: int,
+    fixed: bool = False,
+    buf_index: Optional[int] = None
+) -> None:
+    """
+    准备一次写入请求，以文件序号作为 user_data
+    
+    Args:
+        ring: io_uring 实例
+        index: 文件序号
+        target: 文件描述符（fixed 为 True 时为已注册文件的序号）
+        buffer: 待写入的数据
+        offset: 文件偏移
+        fixed: 是否写入已注册的文件
+        buf_index: 已注册缓冲区的序号（None 表示普通缓冲区）
+    """
+    sqe = liburing.io_uring_get_sqe(ring)
+    if buf_index is not None:
+        liburing.io_uring_prep_write_fixed(sqe, target, buffer, buf_index, offset)
+    else:
+        liburing.io_uring_prep_write(sqe, target, buffer, offset)
+    if fixed:
+        liburing.io_uring_sqe_set_flags(sqe, liburing.IOSQE_FIXED_FILE)
+    liburing.io_uring_sqe_set_data64(sqe, index)
+
+
+def _wait_all(
+    ring,
+    paths: list[str],
+    targets: list[int],
+    buffers: list[bytes],
+    fixed: bool = False
+) -> None:
+    """
+    提交所有写入请求并等待完成，短写入时补写剩余部分
+    
+    Args:
+        ring: io_uring 实例
+        paths: 文件路径列表（用于错误信息）
+        targets: 文件描述符或已注册文件的序号列表
+        buffers: 数据列表
+        fixed: 是否写入已注册的文件
+    
+    Raises:
+        OSError: 任一写入失败
+    """
+    written = [0] * len(buffers)
+    # 补写的数据切片需保持引用直到写入完成
+    tails: dict[int, bytes] = {}
+    pending = len(buffers)
+    cqe = liburing.Cqe()
+    
+    liburing.io_uring_submit(ring)
+    while pending:
+        liburing.io_uring_wait_cqe(ring, cqe)
+        entry = cqe[0]
+        index, res = entry.user_data, entry.res
+        liburing.io_uring_cqe_seen(ring, entry)
+        pending -= 1
+        
+        if res < 0:
+            raise OSError(-res, os.strerror(-res), paths[index])
+        
+        written[index] += res
+        remaining = len(buffers[index]) - written[index]
+        if remaining > 0:
+            if res == 0:
+                raise OSError(f"写入中断: {paths[index]}")
+            # 剩余部分不在已注册缓冲区的起始位置，使用普通写入
+            tails[index] = buffers[index][written[index]:]
+            _prep_write(ring, index, targets[index], tails[index], written[index], fixed=fixed)
+            liburing.io_uring_submit(ring)
+            pending += 1